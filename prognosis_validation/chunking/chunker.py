@@ -1,10 +1,11 @@
-from typing import List, Dict, Any
-import regex
+from typing import Dict, Any, Iterator, List
+import re
+import xxhash
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import datetime
-from functools import lru_cache
 
-@dataclass
+@dataclass(slots=True)
 class MedicalChunk:
     content: str
     section_type: str
@@ -12,110 +13,168 @@ class MedicalChunk:
     chunk_id: str
     metadata: Dict[str, Any]
 
+# Patterns are compiled once at import and shared by every chunker
+# instance, so pool workers that build a chunker per document pay no
+# per-instance compile cost
+_RAW_PRESERVE_PATTERNS = [
+    r'\b\d{1,2}/\d{1,2}/\d{2,4}\b',
+    r'\b\d+\s*(?:mg|ml|g|kg|mm|cm|%)\b',
+    r'\b(?:Dr\.|Pt\.|Rx)\s+\w+',
+    r'\b[A-Z]{2,5}\d{3,}\b',
+    r'\b(?:qid|bid|tid|qd|prn)\b',
+    r'\b\d+\s*(?:x|times)\s*per\s+day\b',
+    r'\b(?:BP|HR|RR|SpO2)\s*:\s*\d+',
+    r'\b[A-Z]\d+\.\d+\b',
+]
+_PROTECT_TOKENS = [f'__PROTECT_{i}__' for i in range(len(_RAW_PRESERVE_PATTERNS))]
+
+# Single alternation so protection is one pass over the text instead of one per pattern
+_PROTECT_UNION = re.compile(
+    '|'.join(f'(?P<p{i}>{pattern})' for i, pattern in enumerate(_RAW_PRESERVE_PATTERNS))
+)
+
+_COMBINED_BREAK_PATTERN = re.compile(
+    r'(?<=\.)\s+(?=[A-Z])|(?<=:)\s+|\n\s*\n|(?<=\))\s+(?=[A-Z])|•\s*|\*\s*|[\d]+\.\s*'
+)
+
+_MEASUREMENT_PATTERN = re.compile(r'\b\d+\s*(?:mg|ml|g|kg)\b')
+_DATE_PATTERN = re.compile(r'\b\d{1,2}/\d{1,2}/\d{2,4}\b')
+_CODE_PATTERN = re.compile(r'\b[A-Z]\d+\.\d+\b')
+
 class MedicalDocumentChunker:
     def __init__(self, 
                  max_chunk_size: int = 500,
                  min_chunk_size: int = 100):
         self.max_chunk_size = max_chunk_size
         self.min_chunk_size = min_chunk_size
-        
-        self._compile_patterns()
-        
-        self.combined_break_pattern = regex.compile(
-            r'(?<=\.)\s+(?=[A-Z])|(?<=:)\s+|\n\s*\n|(?<=\))\s+(?=[A-Z])|•\s*|\*\s*|[\d]+\.\s*',
-            regex.V1
-        )
+        self._protect_cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._protect_cache_size = 128
 
-    def _compile_patterns(self):
-        self.preserve_patterns = [
-            (regex.compile(pattern), f'__PROTECT_{i}__') for i, pattern in enumerate([
-                r'\b\d{1,2}/\d{1,2}/\d{2,4}\b',
-                r'\b\d+\s*(?:mg|ml|g|kg|mm|cm|%)\b',
-                r'\b(?:Dr\.|Pt\.|Rx)\s+\w+',
-                r'\b[A-Z]{2,5}\d{3,}\b',
-                r'\b(?:qid|bid|tid|qd|prn)\b',
-                r'\b\d+\s*(?:x|times)\s*per\s+day\b',
-                r'\b(?:BP|HR|RR|SpO2)\s*:\s*\d+',
-                r'\b[A-Z]\d+\.\d+\b',
-            ])
-        ]
-        
-        self.measurement_pattern = regex.compile(r'\b\d+\s*(?:mg|ml|g|kg)\b')
-        self.date_pattern = regex.compile(r'\b\d{1,2}/\d{1,2}/\d{2,4}\b')
-        self.code_pattern = regex.compile(r'\b[A-Z]\d+\.\d+\b')
+        # Bind the shared module-level patterns; no compile work per instance
+        self.combined_break_pattern = _COMBINED_BREAK_PATTERN
+        self._protect_tokens = _PROTECT_TOKENS
+        self._protect_union = _PROTECT_UNION
+        self.measurement_pattern = _MEASUREMENT_PATTERN
+        self.date_pattern = _DATE_PATTERN
+        self.code_pattern = _CODE_PATTERN
 
-    @lru_cache(maxsize=1024)
     def _protect_patterns(self, text: str) -> str:
-        protected_text = text
-        for pattern, replacement in self.preserve_patterns:
-            protected_text = pattern.sub(replacement, protected_text)
+        # Key on the full text: a str caches its hash after the first
+        # computation and equality only runs against hash-equal entries, so
+        # lookups stay cheap without risking collisions between sections
+        # that merely share a templated prefix/suffix
+        cached = self._protect_cache.get(text)
+        if cached is not None:
+            self._protect_cache.move_to_end(text)
+            return cached
+
+        protected_text = self._protect_union.sub(
+            lambda m: self._protect_tokens[int(m.lastgroup[1:])], text
+        )
+        self._protect_cache[text] = protected_text
+        if len(self._protect_cache) > self._protect_cache_size:
+            self._protect_cache.popitem(last=False)
         return protected_text
 
-    @lru_cache(maxsize=1024)
     def _restore_patterns(self, text: str) -> str:
         restored_text = text
-        for i in range(len(self.preserve_patterns)):
-            restored_text = restored_text.replace(f'__PROTECT_{i}__', ' ')
+        for token in self._protect_tokens:
+            restored_text = restored_text.replace(token, ' ')
         return restored_text
 
-    def chunk_section(self, section) -> List[MedicalChunk]:
-        if not section.content.strip():
-            return []
+    def chunk_section(self, section) -> Iterator[MedicalChunk]:
+        """Lazily yield chunks so only one chunk's metadata is live at a time"""
+        # isspace scans in C without allocating a stripped copy of the content
+        if not section.content or section.content.isspace():
+            return
+
+        # Snapshot the timestamp once per section instead of once per chunk
+        created_at = datetime.now().isoformat()
 
         if section.title == "table":
-            return [self._create_chunk(
+            yield self._create_chunk(
                 f"TABLE:\n{section.content}",
                 "table",
-                section.page_num
-            )]
+                section.page_num,
+                created_at
+            )
+            return
 
         protected_text = self._protect_patterns(section.content)
-        segments = [s.strip() for s in self.combined_break_pattern.split(protected_text) if s.strip()]
-        
-        chunks = []
+
         current_chunk = []
         current_length = 0
-        
-        for segment in segments:
-            restored_segment = self._restore_patterns(segment)
-            seg_length = len(restored_segment)
-            
+
+        for start, end in self._segment_spans(protected_text):
+            segment = protected_text[start:end]
+            seg_length = end - start
+
             if current_length + seg_length > self.max_chunk_size and current_chunk:
-                chunks.append(self._create_chunk(
-                    " ".join(current_chunk),
+                yield self._create_chunk(
+                    self._restore_patterns(" ".join(current_chunk)),
                     section.title,
-                    section.page_num
-                ))
+                    section.page_num,
+                    created_at
+                )
                 current_chunk = []
                 current_length = 0
-            
-            current_chunk.append(restored_segment)
+
+            current_chunk.append(segment)
             current_length += seg_length
-            
-            if any(p.search(restored_segment) for p in [self.measurement_pattern, self.date_pattern]):
-                chunks.append(self._create_chunk(
-                    " ".join(current_chunk),
+
+            # Dates and measurements were already rewritten to protect tokens,
+            # so a substring check replaces two regex scans of restored text.
+            # Gate the flush on min_chunk_size so dosing-heavy sections don't
+            # thrash into a stream of tiny chunks
+            if current_length >= self.min_chunk_size and (
+                    self._protect_tokens[0] in segment or self._protect_tokens[1] in segment):
+                yield self._create_chunk(
+                    self._restore_patterns(" ".join(current_chunk)),
                     section.title,
-                    section.page_num
-                ))
+                    section.page_num,
+                    created_at
+                )
                 current_chunk = []
                 current_length = 0
-        
+
         if current_chunk:
-            chunks.append(self._create_chunk(
-                " ".join(current_chunk),
+            yield self._create_chunk(
+                self._restore_patterns(" ".join(current_chunk)),
                 section.title,
-                section.page_num
-            ))
-        
-        return chunks
+                section.page_num,
+                created_at
+            )
+
+    def _segment_spans(self, text: str) -> List[tuple]:
+        """Find (start, end) spans of non-empty segments between break matches.
+
+        Works on offsets into the original buffer so segments are only
+        sliced out when a chunk is actually emitted, instead of
+        materializing and stripping every segment up front.
+        """
+        spans = []
+        pos = 0
+        boundaries = [(m.start(), m.end()) for m in self.combined_break_pattern.finditer(text)]
+        boundaries.append((len(text), len(text)))
+
+        for break_start, break_end in boundaries:
+            start, end = pos, break_start
+            pos = break_end
+            while start < end and text[start].isspace():
+                start += 1
+            while end > start and text[end - 1].isspace():
+                end -= 1
+            if start < end:
+                spans.append((start, end))
+
+        return spans
 
-    def _create_chunk(self, content: str, section_type: str, page_num: int) -> MedicalChunk:
+    def _create_chunk(self, content: str, section_type: str, page_num: int, created_at: str) -> MedicalChunk:
         metadata = {
             'section_type': section_type,
             'page_num': page_num,
             'chunk_length': len(content),
-            'created_at': datetime.now().isoformat(),
+            'created_at': created_at,
             'contains_measurements': bool(self.measurement_pattern.search(content)),
             'contains_dates': bool(self.date_pattern.search(content)),
             'contains_codes': bool(self.code_pattern.search(content)),
@@ -126,6 +185,6 @@ class MedicalDocumentChunker:
             content=content,
             section_type=section_type,
             page_num=page_num,
-            chunk_id=f"{section_type}_{page_num}_{hash(content)}",
+            chunk_id=f"{section_type}_{page_num}_{xxhash.xxh3_64_intdigest(content)}",
             metadata=metadata
         )
\ No newline at end of file
@@ -1,20 +1,74 @@
 import os
 import logging
+import queue
+import tempfile
+import threading
+from bisect import bisect_right
 from pathlib import Path
+from PIL import Image
 from typing import Dict, List, Optional, Tuple
 from collections import defaultdict
-import pytesseract
-from pdf2image import convert_from_path
+import ahocorasick
+from tesserocr import PyTessBaseAPI, PSM, OEM, RIL, iterate_level
+from pdf2image import convert_from_path, pdfinfo_from_path
 import numpy as np
 import cv2
+from numba import njit, prange
 from dataclasses import dataclass
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Shared by the page worker threads; tesserocr and OpenCV release the GIL,
+# so threads give real parallelism here without any pickling of page data
+_MARKER_AUTOMATON = None
+_THREAD_STATE = threading.local()
+
+def _init_worker():
+    """Create the per-thread Tesseract instance once at thread startup"""
+    # One page per thread at a time: keep Tesseract's internal OpenMP
+    # threads from oversubscribing the cores the pool already occupies
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+    # Persistent Tesseract instance: the LSTM model stays resident for the
+    # thread's lifetime instead of being reloaded by a subprocess per page
+    _THREAD_STATE.api = PyTessBaseAPI(psm=PSM.SINGLE_COLUMN, oem=OEM.LSTM_ONLY)
+
+    # Trigger the numba JIT on a tiny image so the first real page
+    # doesn't pay compilation latency
+    remove_watermark(np.zeros((64, 64, 3), np.uint8))
+
+def _ocr_page(processed_image: np.ndarray) -> Dict:
+    """Run OCR on a preprocessed page via the worker's persistent API.
+
+    Returns the same text/left/top/width/height dict layout that
+    pytesseract.image_to_data produced, so extract_sections is unchanged.
+    """
+    api = _THREAD_STATE.api
+    api.SetImage(Image.fromarray(processed_image))
+    api.Recognize()
+
+    ocr_data = {'text': [], 'left': [], 'top': [], 'width': [], 'height': []}
+    iterator = api.GetIterator()
+    if iterator is None:
+        return ocr_data
+
+    for word in iterate_level(iterator, RIL.WORD):
+        try:
+            text = word.GetUTF8Text(RIL.WORD)
+            x1, y1, x2, y2 = word.BoundingBox(RIL.WORD)
+        except RuntimeError:
+            continue
+        ocr_data['text'].append(text)
+        ocr_data['left'].append(x1)
+        ocr_data['top'].append(y1)
+        ocr_data['width'].append(x2 - x1)
+        ocr_data['height'].append(y2 - y1)
+
+    return ocr_data
+
+@dataclass(slots=True)
 class MedicalSection:
     """Represents a logical section in a medical document"""
     title: str
@@ -30,96 +84,133 @@ def remove_watermark(image: np.ndarray) -> np.ndarray:
     Returns:
         Processed grayscale image with watermarks removed
     """
-    # Convert to HSV color space
-    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    
-    # Define purple range (adjust based on exact hue)
-    lower_purple = np.array([120, 40, 40])  # Hue: 120-160 (purple range)
-    upper_purple = np.array([160, 255, 255])
-    
-    # Create mask for purple regions
-    mask = cv2.inRange(hsv, lower_purple, upper_purple)
-    
-    # Invert mask to keep non-purple regions
-    inverted_mask = cv2.bitwise_not(mask)
-    
-    # Apply mask to original image
-    result = cv2.bitwise_and(image, image, mask=inverted_mask)
-    
-    # Convert to grayscale and enhance contrast
-    gray = cv2.cvtColor(result, cv2.COLOR_BGR2GRAY)
-    _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    
+    gray = np.empty(image.shape[:2], np.uint8)
+    _watermark_kernel(image, gray)
+
+    # Otsu only needs a histogram to pick the threshold; compute it on a
+    # quarter-scale image and apply the resulting value at full size, so
+    # the extra full-image scan is replaced by a 1/16-size one
+    small = cv2.resize(gray, None, fx=0.25, fy=0.25, interpolation=cv2.INTER_AREA)
+    otsu_t, _ = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    _, thresh = cv2.threshold(gray, otsu_t, 255, cv2.THRESH_BINARY)
+
     return thresh
 
-def process_single_page(page_data, section_markers):
+@njit(parallel=True, fastmath=True, cache=True)
+def _watermark_kernel(image, out):
+    """Fused per-pixel purple-mask + grayscale pass, rows split across cores.
+
+    Inline HSV classification for the purple band, on OpenCV's hue scale
+    (0-179): hue 120-150 are blue-max pixels with H = 120 + 30*(r-g)/delta
+    (r >= g puts them in band automatically), and hue 150-160 are red-max
+    pixels with H = 180 - 30*(b-g)/delta, i.e. 3*(b-g) >= 2*delta.
+    """
+    height, width = out.shape
+    for i in prange(height):
+        for j in range(width):
+            b = np.int32(image[i, j, 0])
+            g = np.int32(image[i, j, 1])
+            r = np.int32(image[i, j, 2])
+
+            v = max(b, g, r)
+            delta = v - min(b, g, r)
+
+            # saturation >= 40 rewritten as 255*delta >= 40*v to stay integral
+            if (v >= 40 and 255 * delta >= 40 * v
+                    and ((v == b and r >= g)
+                         or (v == r and b >= g and 3 * (b - g) >= 2 * delta))):
+                # Purple pixels are zeroed, as the masking pass did before
+                out[i, j] = 0
+            else:
+                out[i, j] = np.uint8(0.114 * b + 0.587 * g + 0.299 * r)
+
+def process_single_page(page_data):
     """Process a single page with watermark removal and OCR"""
-    page_num, image = page_data
-    
-    # Convert PIL image to numpy array
-    image_np = np.array(image)
-    
-    # Step 1: Remove watermark
-    processed_image = remove_watermark(image_np)
-    
-    # Step 2: Perform OCR on the processed image
-    ocr_data = pytesseract.image_to_data(
-        processed_image,
-        output_type=pytesseract.Output.DICT,
-        config='--oem 1 --psm 4'  # LSTM engine + single column mode
-    )
-    
-    # Step 3: Extract sections
-    sections = extract_sections(ocr_data, page_num, section_markers)
-    
-    return page_num, sections
+    page_num, image_path = page_data
+
+    try:
+        # cv2.imread decodes straight into a BGR uint8 array in C, skipping
+        # PIL's decode plus the extra np.array copy
+        image_np = cv2.imread(str(image_path), cv2.IMREAD_COLOR)
+        if image_np is None:
+            raise IOError(f"Could not read page image {image_path}")
 
-def extract_sections(ocr_data: Dict, page_num: int, section_markers: Dict) -> List[MedicalSection]:
+        # Step 1: Remove watermark
+        processed_image = remove_watermark(image_np)
+
+        # Step 2: Perform OCR on the processed image
+        ocr_data = _ocr_page(processed_image)
+
+        # Step 3: Extract sections
+        sections = extract_sections(ocr_data, page_num, _MARKER_AUTOMATON)
+
+        return page_num, sections
+    except Exception as e:
+        logger.error(f"Error processing page {page_num}: {e}")
+        return page_num, []
+    finally:
+        # Free the page file as soon as OCR is done
+        try:
+            os.unlink(image_path)
+        except OSError:
+            pass
+
+def extract_sections(ocr_data: Dict, page_num: int, marker_automaton: "ahocorasick.Automaton") -> List[MedicalSection]:
     """Extract logical sections from OCR data"""
     sections = []
-    current_section = None
-    current_text = []
-    
-    for i, text in enumerate(ocr_data['text']):
-        if not text.strip():
+
+    # Drop the mostly-blank OCR entries with one vectorized pass so the
+    # Python loop only visits tokens that carry text
+    texts = np.asarray(ocr_data['text'], dtype=object)
+    stripped = np.char.strip(texts.astype(str))
+    keep = np.flatnonzero(stripped.astype(bool))
+
+    if keep.size == 0:
+        return sections
+
+    tokens = [stripped[i] for i in keep]
+
+    # Scan the whole page once instead of per token; this also matches
+    # markers that span token boundaries (e.g. 'Patient Name'), which the
+    # per-token check could never see
+    joined = ' '.join(tokens).lower()
+
+    # Character offset where each token starts in the joined string
+    token_starts = []
+    offset = 0
+    for token in tokens:
+        token_starts.append(offset)
+        offset += len(token) + 1
+
+    # Header matches as (first token, last token, section_type) positions
+    boundaries = []
+    for end_char, (section_type, marker_len) in marker_automaton.iter(joined):
+        start_pos = bisect_right(token_starts, end_char - marker_len + 1) - 1
+        end_pos = bisect_right(token_starts, end_char) - 1
+        if boundaries and start_pos <= boundaries[-1][1]:
+            continue  # overlapping match inside the same header tokens
+        boundaries.append((start_pos, end_pos, section_type))
+
+    # Content of each section runs from after its header tokens up to the
+    # start of the next header
+    for idx, (start_pos, end_pos, section_type) in enumerate(boundaries):
+        content_start = end_pos + 1
+        content_end = boundaries[idx + 1][0] if idx + 1 < len(boundaries) else len(tokens)
+        if content_start >= content_end:
             continue
-            
-        # Check if this is a section header
-        section_type = identify_section_type(text, section_markers)
-        
-        if section_type:
-            # Save previous section if it exists
-            if current_section and current_text:
-                sections.append(MedicalSection(
-                    title=current_section,
-                    content=' '.join(current_text),
-                    page_num=page_num,
-                    bbox=get_text_bbox(ocr_data, i)
-                ))
-            
-            # Start new section
-            current_section = section_type
-            current_text = []
-        else:
-            current_text.append(text)
-    
-    # Don't forget the last section
-    if current_section and current_text:
         sections.append(MedicalSection(
-            title=current_section,
-            content=' '.join(current_text),
+            title=section_type,
+            content=' '.join(tokens[content_start:content_end]),
             page_num=page_num,
-            bbox=get_text_bbox(ocr_data, len(ocr_data['text']) - 1)
+            bbox=get_text_bbox(ocr_data, int(keep[start_pos]))
         ))
-    
+
     return sections
 
-def identify_section_type(text: str, section_markers: Dict) -> Optional[str]:
+def identify_section_type(text: str, marker_automaton: "ahocorasick.Automaton") -> Optional[str]:
     """Identify if text is a section header"""
-    text = text.lower().strip()
-    for section_type, markers in section_markers.items():
-        if any(marker.lower() in text for marker in markers):
-            return section_type
+    for _, (section_type, _marker_len) in marker_automaton.iter(text.lower()):
+        return section_type
     return None
 
 def get_text_bbox(ocr_data: Dict, index: int) -> Tuple[int, int, int, int]:
@@ -152,44 +243,119 @@ class ParallelMedicalDocumentProcessor:
             'imaging': ['Imaging', 'X-ray', 'MRI', 'CT Scan'],
         }
 
+        # Build a single Aho-Corasick automaton over all markers so header
+        # detection is one linear scan per token instead of a substring
+        # check per (section, marker) pair
+        self._marker_automaton = ahocorasick.Automaton()
+        for section_type, markers in self.section_markers.items():
+            for marker in markers:
+                # Marker length travels with the value so matches can be
+                # mapped back to the tokens they started in
+                self._marker_automaton.add_word(marker.lower(), (section_type, len(marker)))
+        self._marker_automaton.make_automaton()
+
+        # Lazily created worker pool, reused across process_pdf calls so
+        # thread and Tesseract setup is paid once per batch, not per PDF
+        self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Create the shared worker pool on first use and reuse it afterwards"""
+        if self._executor is None:
+            # Threads share the automaton directly; no pickling involved
+            global _MARKER_AUTOMATON
+            _MARKER_AUTOMATON = self._marker_automaton
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker
+            )
+        return self._executor
+
+    def close(self):
+        """Shut down the shared worker pool"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     def process_pdf(self, pdf_path: str) -> List[MedicalSection]:
         """Process a medical PDF document and extract structured sections in parallel"""
         logger.info(f"Processing PDF: {pdf_path}")
         
         try:
-            # Convert PDF to images
-            images = convert_from_path(pdf_path)
-            
-            # Create page data tuples (page_num, image)
-            page_data = [(i+1, img) for i, img in enumerate(images)]
-            
-            # Process pages in parallel
-            all_sections = []
-            process_func = partial(process_single_page, section_markers=self.section_markers)
-            
-            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
-                # Submit all pages for processing
-                future_to_page = {
-                    executor.submit(process_func, pd): pd[0] 
-                    for pd in page_data
-                }
-                
-                # Collect results as they complete
-                page_sections = {}
-                for future in as_completed(future_to_page):
-                    page_num = future_to_page[future]
+            with tempfile.TemporaryDirectory() as td:
+                total_pages = pdfinfo_from_path(pdf_path)['Pages']
+                window = max(1, self.max_workers)
+
+                # Bounded queue plus an in-flight gate below keep only a
+                # small window of page files on disk at any time
+                page_queue = queue.Queue(maxsize=2 * self.max_workers)
+                raster_error = []
+
+                def rasterize():
+                    """Render pages window by window, handing paths over as they appear"""
                     try:
-                        _, sections = future.result()
-                        page_sections[page_num] = sections
+                        for first in range(1, total_pages + 1, window):
+                            last = min(first + window - 1, total_pages)
+                            paths = convert_from_path(
+                                pdf_path,
+                                # 200 DPI is enough for the LSTM engine on these
+                                # scans; raster cost scales quadratically with DPI.
+                                # Color stays on because the watermark mask needs it
+                                dpi=200,
+                                fmt='ppm',  # uncompressed, so write and read are plain memcpy
+                                first_page=first,
+                                last_page=last,
+                                thread_count=min(4, self.max_workers),
+                                output_folder=td,
+                                paths_only=True
+                            )
+                            for i, path in enumerate(paths):
+                                page_queue.put((first + i, path))
                     except Exception as e:
-                        logger.error(f"Error processing page {page_num}: {e}")
-                        continue
-                
-                # Combine sections in page order
-                for page_num in sorted(page_sections.keys()):
-                    all_sections.extend(page_sections[page_num])
-                    logger.info(f"Processed page {page_num}: Found {len(page_sections[page_num])} sections")
-            
+                        # Hand the failure back to the consumer; swallowing it
+                        # here would make a corrupt PDF look like an empty one
+                        raster_error.append(e)
+                    finally:
+                        page_queue.put(None)
+
+                producer = threading.Thread(target=rasterize, daemon=True)
+                producer.start()
+
+                # Submit OCR work as pages arrive so Poppler and Tesseract
+                # run concurrently instead of back to back. The semaphore
+                # stalls submission (and, through the bounded queue, the
+                # producer) once 2*max_workers pages are in flight, so the
+                # window invariant actually holds
+                executor = self._get_executor()
+                in_flight = threading.Semaphore(2 * self.max_workers)
+                futures = []
+                while True:
+                    item = page_queue.get()
+                    if item is None:
+                        break
+                    in_flight.acquire()
+                    future = executor.submit(process_single_page, item)
+                    future.add_done_callback(lambda _f: in_flight.release())
+                    futures.append(future)
+
+                page_results = [future.result() for future in futures]
+                producer.join()
+
+                if raster_error:
+                    # Fail the document rather than returning a partial or
+                    # empty result that would be cached as processed
+                    raise raster_error[0]
+
+            all_sections = []
+            for page_num, sections in sorted(page_results, key=lambda r: r[0]):
+                all_sections.extend(sections)
+                logger.info(f"Processed page {page_num}: Found {len(sections)} sections")
+
             return all_sections
             
         except Exception as e:
@@ -1,5 +1,8 @@
-import json
+import orjson
+import hashlib
 import logging
+import threading
+from functools import partial
 import argparse
 import logging.config
 from pathlib import Path
@@ -18,6 +21,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _chunk_section_list(chunker: MedicalDocumentChunker, section) -> List[MedicalChunk]:
+    """Materialize chunks inside the worker; generators can't cross process boundaries"""
+    return list(chunker.chunk_section(section))
+
 class ParallelMedicalDocumentPipeline:
     """Orchestrates the complete document processing pipeline with watermark removal and parallel processing"""
     
@@ -25,7 +32,8 @@ class ParallelMedicalDocumentPipeline:
                  data_dir: str = 'data',
                  output_dir: str = 'processed',
                  chunk_size: int = 500,
-                 max_workers: int = None):
+                 max_workers: int = None,
+                 pretty_output: bool = False):
         
         # Validate directories
         self.data_dir = Path(data_dir)
@@ -34,6 +42,7 @@ class ParallelMedicalDocumentPipeline:
             
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True, parents=True)
+        self.pretty_output = pretty_output
         
         # Configure workers
         self.max_workers = max_workers or min(os.cpu_count(), 4)  # Prevent over-subscription
@@ -58,7 +67,7 @@ class ParallelMedicalDocumentPipeline:
             
             # Step 2: Parallel Chunking with process pool
             with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
-                futures = [executor.submit(self.chunker.chunk_section, section) 
+                futures = [executor.submit(_chunk_section_list, self.chunker, section)
                           for section in sections]
                 
                 all_chunks = []
@@ -88,6 +97,15 @@ class ParallelMedicalDocumentPipeline:
         
         return document_data
     
+    def save_processed_data(self, data: Dict, output_path: Path):
+        """Write processed document data as JSON"""
+        # Intermediate files are machine-consumed, so default to compact
+        # encoding; indentation is opt-in for manual audits via --pretty
+        option = orjson.OPT_INDENT_2 if self.pretty_output else 0
+        # orjson encodes UTF-8 natively and is far faster than stdlib json
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(data, option=option))
+
     def _serialize_chunk(self, chunk: MedicalChunk) -> Dict:
         """Ensure datetime serialization in metadata"""
         return {
@@ -104,8 +122,12 @@ class ParallelMedicalDocumentPipeline:
 def process_single_file(pdf_path: Path, pipeline: ParallelMedicalDocumentPipeline) -> bool:
     """Wrapper function for parallel file processing"""
     try:
-        output_path = pipeline.output_dir / f"{pdf_path.stem}_processed.json"
-        
+        # Key the output by content hash so a changed PDF with the same name
+        # is reprocessed and an unchanged (or renamed) one is skipped
+        with open(pdf_path, 'rb') as f:
+            content_hash = hashlib.file_digest(f, 'sha256').hexdigest()
+        output_path = pipeline.output_dir / f"{pdf_path.stem}.{content_hash[:12]}.json"
+
         if output_path.exists():
             logger.info(f"Skipping already processed file: {pdf_path.name}")
             return True
@@ -124,6 +146,7 @@ def main():
     parser.add_argument('--output-dir', default='processed', help='Output directory')
     parser.add_argument('--chunk-size', type=int, default=500, help='Maximum chunk size')
     parser.add_argument('--max-workers', type=int, default=None, help='Maximum parallel workers')
+    parser.add_argument('--pretty', action='store_true', help='Indent output JSON for manual review')
     args = parser.parse_args()
     
     # Initialize pipeline
@@ -131,30 +154,38 @@ def main():
         data_dir=args.data_dir,
         output_dir=args.output_dir,
         chunk_size=args.chunk_size,
-        max_workers=args.max_workers
+        max_workers=args.max_workers,
+        pretty_output=args.pretty
     )
     
-    # Get all PDF files
-    pdf_files = list(pipeline.data_dir.glob('*.pdf'))
-    if not pdf_files:
+    # Process files in parallel. Pages inside each PDF are handled by a
+    # thread pool, so size the outer process pool by the per-file thread
+    # count to avoid oversubscribing cores
+    outer_workers = max(1, (os.cpu_count() or 1) // pipeline.max_workers)
+
+    # Bound the number of in-flight PDFs so huge directories don't pile
+    # every pending future (and its result) into memory at once
+    in_flight = threading.Semaphore(2 * outer_workers)
+
+    def on_file_done(future, pdf_path: Path):
+        in_flight.release()
+        try:
+            if future.result():
+                logger.info(f"Completed processing: {pdf_path.name}")
+        except Exception as e:
+            logger.error(f"Unexpected error with {pdf_path.name}: {str(e)}")
+
+    found_pdfs = False
+    with ProcessPoolExecutor(max_workers=outer_workers) as executor:
+        # Iterate the glob lazily; acquire blocks until a slot frees up
+        for pdf_path in pipeline.data_dir.glob('*.pdf'):
+            found_pdfs = True
+            in_flight.acquire()
+            future = executor.submit(process_single_file, pdf_path, pipeline)
+            future.add_done_callback(partial(on_file_done, pdf_path=pdf_path))
+
+    if not found_pdfs:
         logger.warning(f"No PDF files found in {pipeline.data_dir}")
-        return
-    
-    # Process files in parallel
-    with ProcessPoolExecutor(max_workers=pipeline.max_workers) as executor:
-        futures = {
-            executor.submit(process_single_file, pdf_path, pipeline): pdf_path
-            for pdf_path in pdf_files
-        }
-        
-        for future in as_completed(futures):
-            pdf_path = futures[future]
-            try:
-                success = future.result()
-                if success:
-                    logger.info(f"Completed processing: {pdf_path.name}")
-            except Exception as e:
-                logger.error(f"Unexpected error with {pdf_path.name}: {str(e)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -57,7 +57,15 @@ app.add_middleware(
 
 # MongoDB configuration
 MONGO_URL = "mongodb://localhost:27017"
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL)
+# Explicit pool sizing: keep warm connections around for burst traffic
+# instead of paying TCP handshakes per request spike
+client = motor.motor_asyncio.AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=200,
+    minPoolSize=10,
+    retryWrites=True,
+    appname="diagnosure-rag",
+)
 db = client.medical_records
 prescreens_collection = db.prescreens
 